@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import socket
+import statistics
+import tempfile
+import threading
+import time
+
+import db_manager
+from outbound import ClientConnection, CHAT, MAX_CHAT_BACKLOG
+from server import ChatServer
+
+UNBOUNDED = 10_000_000
+
+class FifoConnection(ClientConnection):
+    """Everything through one unbounded queue, the baseline before lanes"""
+    def __init__(self, sock):
+        super().__init__(sock, max_chat_backlog=UNBOUNDED)
+
+    def send(self, data, priority=CHAT):
+        super().send(data, CHAT)
+
+def stamped(text):
+    return {"t": time.perf_counter(), "text": text}
+
+def run(mode, seconds, clients, slow_clients, producers, control_interval, search_interval, reader_delay):
+    """
+    Connects `clients` socketpairs to a real ChatServer, floods them with chat
+    through ChatServer.broadcast_packet from several threads, and meanwhile
+    broadcasts a SYSTEM frame every control_interval and sends each client a
+    SEARCH_RESULTS page every search_interval. Measures queue-to-receive latency
+    per packet class, separately for normal and slow readers.
+    Modes, so the effect of prioritising and of shedding can be told apart:
+      "fifo"       everything through one unbounded queue
+      "lanes"      lanes by priority, chat lane unbounded (nothing shed)
+      "lanes+shed" lanes by priority, chat lane capped at MAX_CHAT_BACKLOG
+    """
+    server = ChatServer("127.0.0.1", 0)
+    pairs = []
+    for i in range(clients):
+        server_end, client_end = socket.socketpair()
+        if mode == "fifo":
+            connection = FifoConnection(server_end)
+        elif mode == "lanes":
+            connection = ClientConnection(server_end, max_chat_backlog=UNBOUNDED)
+        else:
+            connection = ClientConnection(server_end)
+        server.clients.add(f"user{i}", connection)
+        pairs.append((connection, client_end, i < slow_clients))
+
+    latencies = {slow: {"SYSTEM": [], "CHAT": [], "SEARCH_RESULTS": []} for slow in (False, True)}
+    shed_notices = [0]
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def reader(client_end, slow):
+        rfile = client_end.makefile('rb')
+        for line in rfile:
+            if not line.endswith(b"\n"):
+                break # Cut off when the connection closed
+            packet = json.loads(line)
+            now = time.perf_counter()
+            if not isinstance(packet["content"], dict):
+                with lock:
+                    shed_notices[0] += 1
+                continue
+            with lock:
+                latencies[slow][packet["type"]].append((now - packet["content"]["t"]) * 1000)
+            if slow:
+                time.sleep(reader_delay)
+
+    def chat_producer():
+        while not stop.is_set():
+            server.broadcast_packet({"type": "CHAT", "sender": "bench", "content": stamped("x" * 100), "is_private": False})
+
+    def control_producer():
+        while not stop.is_set():
+            server.broadcast_packet({"type": "SYSTEM", "sender": "Server", "content": stamped("someone joined")})
+            time.sleep(control_interval)
+
+    def search_producer():
+        results = [{"id": i, "sender": "bench", "target": "Everyone", "content": "x" * 100, "timestamp": 0.0}
+                   for i in range(db_manager.SEARCH_PAGE_SIZE)]
+        while not stop.is_set():
+            for connection in server.clients.connections():
+                content = stamped("")
+                content["results"] = results
+                server.send_packet(connection, "SEARCH_RESULTS", content)
+            time.sleep(search_interval)
+
+    readers = [threading.Thread(target=reader, args=(client_end, slow)) for _, client_end, slow in pairs]
+    for t in readers:
+        t.daemon = True
+        t.start()
+    threads = [threading.Thread(target=chat_producer) for _ in range(producers)]
+    threads.append(threading.Thread(target=control_producer))
+    threads.append(threading.Thread(target=search_producer))
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    # Flushes what is still queued (up to CLOSE_TIMEOUT each, in parallel), then let the readers finish
+    closers = [threading.Thread(target=connection.close) for connection, _, _ in pairs]
+    for t in closers:
+        t.start()
+    for t in closers:
+        t.join()
+    for t in readers:
+        t.join()
+    for _, client_end, _ in pairs:
+        client_end.close()
+    server.stop()
+
+    shed = sum(connection.shed for connection, _, _ in pairs)
+    print(f"[{mode.upper()}] chat frames shed: {shed:,} ({shed_notices[0]} notices sent)")
+    for slow, by_type in latencies.items():
+        if slow and not slow_clients:
+            continue
+        who = "slow" if slow else "fast"
+        for packet_type, values in by_type.items():
+            if not values:
+                print(f"[{mode.upper()}] {who} {packet_type:<14} no frames received")
+                continue
+            values.sort()
+            p95 = values[int(len(values) * 0.95) - 1] if len(values) >= 20 else values[-1]
+            print(f"[{mode.upper()}] {who} {packet_type:<14} n={len(values):<9,} p50 {statistics.median(values):8.2f}ms  "
+                  f"p95 {p95:8.2f}ms  max {values[-1]:8.2f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-class latency under a saturating chat broadcast")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--slow-clients", type=int, default=2,
+                        help="how many of the clients read slowly (see --reader-delay)")
+    parser.add_argument("--producers", type=int, default=4)
+    parser.add_argument("--control-interval", type=float, default=0.01)
+    parser.add_argument("--search-interval", type=float, default=0.1)
+    parser.add_argument("--reader-delay", type=float, default=0.001,
+                        help="seconds a slow client sleeps per frame")
+    args = parser.parse_args()
+
+    # ChatServer opens the message database, keep the bench away from the real one
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_NAME = os.path.join(tmp, "bench.db")
+        print(f"[BENCH] {args.clients} clients ({args.slow_clients} slow), {args.producers} chat producers, "
+              f"chat backlog limit {MAX_CHAT_BACKLOG}")
+        for mode in ("fifo", "lanes", "lanes+shed"):
+            run(mode, args.seconds, args.clients, args.slow_clients, args.producers,
+                args.control_interval, args.search_interval, args.reader_delay)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import db_manager
+from registry import ClientRegistry
+from server import ChatServer
+
+GROUPS = ["#General", "#Gamers", "#Coders"]
+STABLE_USERS = 10 # Connected for the whole run, so they must get every broadcast
+
+class FakeSocket:
+    """Stands in for a client socket, sendall just counts bytes"""
+    def __init__(self):
+        self.sent = 0
+
+    def sendall(self, data):
+        self.sent += len(data)
+
+class FakeConnection:
+    """Stands in for a ClientConnection, keeps every frame it is sent"""
+    def __init__(self):
+        self.frames = []
+
+    def send(self, data, priority=None):
+        self.frames.append(data) # list.append is atomic, no lock needed
+
+    def close(self):
+        pass
+
+def check(condition, message):
+    # Not assert, so the stress test still checks under python -O
+    if not condition:
+        raise AssertionError(message)
+
+def stress(seconds, writers, readers):
+    """
+    Joins, leaves and broadcasts from many threads at once through a real
+    ChatServer (broadcast_packet, and the groups.members fan-out used for group
+    chat). Each writer owns its own usernames so it knows exactly who it left
+    connected. Once the threads stop, the registries have to agree with that
+    and every frame has to have reached the right connections exactly once.
+    """
+    server = ChatServer("127.0.0.1", 0)
+    clients, groups = server.clients, server.groups
+    stable = {}
+    for i in range(STABLE_USERS):
+        stable[f"stable{i}"] = FakeConnection()
+        clients.add(f"stable{i}", stable[f"stable{i}"])
+        groups.join("#General", f"stable{i}")
+
+    stop = threading.Event()
+    errors = []
+    writer_results = [None] * writers
+    reader_results = [None] * readers
+
+    def writer(index):
+        rng = random.Random(index)
+        live = {} # username -> group, only this thread touches these names
+        created = []
+        writes = 0
+        try:
+            while not stop.is_set():
+                username = f"w{index}-{rng.randint(0, 25)}"
+                if username in live:
+                    clients.remove(username)
+                    groups.leave_all(username)
+                    del live[username]
+                else:
+                    group = rng.choice(GROUPS)
+                    connection = FakeConnection()
+                    created.append(connection)
+                    clients.add(username, connection)
+                    groups.join(group, username)
+                    live[username] = group
+                writes += 1
+        except Exception as e:
+            errors.append(e)
+        writer_results[index] = (live, created, writes)
+
+    def reader(index):
+        broadcasts = []
+        fanouts = {} # frame -> connections it was handed to
+        i = 0
+        try:
+            while not stop.is_set():
+                i += 1
+                tag = f"r{index}-{i}"
+                server.broadcast_packet({"type": "CHAT", "sender": "bench", "content": tag})
+                broadcasts.append(tag)
+
+                # Same fan-out handle_client does for a group message
+                tag = f"g{index}-{i}"
+                data = tag.encode('utf-8')
+                snapshot = clients.snapshot()
+                delivered = 0
+                for member in groups.members("#General"):
+                    connection = snapshot.get(member)
+                    if connection:
+                        connection.send(data)
+                        delivered += 1
+                fanouts[data] = delivered
+        except Exception as e:
+            errors.append(e)
+        reader_results[index] = (broadcasts, fanouts)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    server.stop()
+
+    if errors:
+        raise errors[0]
+
+    # The registries agree with each other and with what the writers left behind
+    snapshot = clients.snapshot()
+    check(len(clients.connections()) == len(snapshot), "connections() and snapshot() differ in size")
+    check(set(map(id, clients.connections())) == set(map(id, snapshot.values())), "connections() doesn't match snapshot()")
+    expected_users = set(stable)
+    expected_members = {group: set() for group in GROUPS}
+    expected_members["#General"].update(stable)
+    for live, _, _ in writer_results:
+        expected_users.update(live)
+        for username, group in live.items():
+            expected_members[group].add(username)
+    check(set(clients.names()) == expected_users, "live users don't match names()")
+    for group in GROUPS:
+        check(set(groups.members(group)) == expected_members[group], f"{group} members are wrong")
+
+    # Every frame reached the right connections, once each
+    all_broadcasts = [tag for broadcasts, _ in reader_results for tag in broadcasts]
+    all_fanouts = {data: n for _, fanouts in reader_results for data, n in fanouts.items()}
+    received = Counter()
+    connections = list(stable.values()) + [c for _, created, _ in writer_results for c in created]
+    for connection in connections:
+        frames = set(connection.frames)
+        check(len(frames) == len(connection.frames), "a connection got the same frame twice")
+        received.update(frames)
+    for username, connection in stable.items():
+        frames = set(connection.frames)
+        check(sum(1 for frame in frames if frame not in all_fanouts) == len(all_broadcasts), f"{username} missed broadcasts")
+        check(all(data in frames for data in all_fanouts), f"{username} missed a #General frame")
+    for data, delivered in all_fanouts.items():
+        check(received[data] == delivered, "group frame delivery doesn't match the snapshot it was sent to")
+
+    writes = sum(writes for _, _, writes in writer_results)
+    print(f"[STRESS] OK - {writes:,} joins/leaves, {len(all_broadcasts):,} broadcasts, "
+          f"{len(all_fanouts):,} group fan-outs, {len(clients)} users left connected")
+
+def broadcast_cost(connection_counts, rounds):
+    """Time per broadcast, old dict copy vs registry snapshot"""
+    data = b'{"type": "CHAT"}\n'
+    print(f"[BROADCAST] {'connections':>12} {'list(dict) us':>15} {'snapshot us':>13}")
+    for n in connection_counts:
+        clients_dict = {f"user{i}": FakeSocket() for i in range(n)}
+        clients = ClientRegistry()
+        for username, sock in clients_dict.items():
+            clients.add(username, sock)
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for sock in list(clients_dict.values()):
+                sock.sendall(data)
+        old = (time.perf_counter() - start) / rounds * 1e6
+
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for sock in clients.connections():
+                sock.sendall(data)
+        new = (time.perf_counter() - start) / rounds * 1e6
+
+        print(f"[BROADCAST] {n:>12,} {old:>15.1f} {new:>13.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Stress test and benchmark the client registry")
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--writers", type=int, default=8)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    # ChatServer opens the message database, keep the bench away from the real one
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_NAME = os.path.join(tmp, "bench.db")
+        stress(args.seconds, args.writers, args.readers)
+    broadcast_cost([10, 100, 1_000, 10_000, 50_000], args.rounds)
+
+if __name__ == "__main__":
+    main()
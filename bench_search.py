@@ -0,0 +1,81 @@
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+
+import db_manager
+
+WORDS = ["hello", "python", "server", "socket", "thread", "game", "code", "lunch", "meeting",
+         "deploy", "bug", "fix", "release", "coffee", "weekend", "music", "movie", "test",
+         "build", "error", "login", "group", "chat", "message", "window", "network", "packet"]
+USERS = [f"user{i}" for i in range(500)]
+GROUPS = ["#General", "#Gamers", "#Coders"]
+
+def random_message(rng):
+    target_roll = rng.random()
+    if target_roll < 0.4:
+        target = "Everyone"
+    elif target_roll < 0.8:
+        target = rng.choice(GROUPS)
+    else:
+        target = rng.choice(USERS)
+    content = " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 15)))
+    return (rng.choice(USERS), target, content, time.time())
+
+def build(total, batch_size, rng):
+    """Inserts messages through the normal table so the FTS triggers do the indexing"""
+    conn = sqlite3.connect(db_manager.DB_NAME)
+    cursor = conn.cursor()
+    start = time.perf_counter()
+    inserted = 0
+    while inserted < total:
+        count = min(batch_size, total - inserted)
+        cursor.executemany("INSERT INTO messages (sender, target, content, timestamp) VALUES (?, ?, ?, ?)",
+                           [random_message(rng) for _ in range(count)])
+        conn.commit()
+        inserted += count
+        if inserted % (batch_size * 20) == 0 or inserted == total:
+            print(f"  {inserted:,} / {total:,} messages", flush=True)
+    elapsed = time.perf_counter() - start
+    conn.close()
+    return elapsed
+
+def run_queries(queries, rng):
+    latencies = []
+    for _ in range(queries):
+        username = rng.choice(USERS)
+        text = " ".join(rng.sample(WORDS, rng.randint(1, 3)))
+        page = rng.randint(0, db_manager.SEARCH_MAX_PAGES - 1)
+        start = time.perf_counter()
+        db_manager.search_messages(username, text, GROUPS[:2], page=page)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark FTS index build time and search latency")
+    parser.add_argument("--messages", type=int, default=10_000_000)
+    parser.add_argument("--batch", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_manager.DB_NAME = os.path.join(tmp, "bench.db")
+        db_manager.initialize_database()
+
+        print(f"[BUILD] Inserting {args.messages:,} messages...")
+        elapsed = build(args.messages, args.batch, rng)
+        print(f"[BUILD] {elapsed:.1f}s ({args.messages / elapsed:,.0f} messages/s)")
+
+        print(f"[QUERY] Running {args.queries} searches...")
+        latencies = sorted(run_queries(args.queries, rng))
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        print(f"[QUERY] mean {statistics.mean(latencies):.2f}ms  "
+              f"p50 {statistics.median(latencies):.2f}ms  p95 {p95:.2f}ms  max {latencies[-1]:.2f}ms")
+
+if __name__ == "__main__":
+    main()
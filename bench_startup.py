@@ -0,0 +1,72 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+def child():
+    """Runs inside a fresh interpreter, prints import / window / first paint times in ms"""
+    start = time.perf_counter()
+
+    from PyQt6.QtCore import QObject, QEvent
+    from PyQt6.QtWidgets import QApplication
+    import gui_client
+    imported = time.perf_counter()
+
+    app = QApplication(sys.argv)
+    app.setStyleSheet(gui_client.STYLESHEET)
+    window = gui_client.ChatWindow()
+    built = time.perf_counter()
+
+    class FirstPaint(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Type.Paint:
+                painted = time.perf_counter()
+                print(f"{(imported - start) * 1000:.1f} {(built - start) * 1000:.1f} {(painted - start) * 1000:.1f}", flush=True)
+                app.quit()
+            return False
+
+    paint_filter = FirstPaint()
+    window.installEventFilter(paint_filter)
+    window.show()
+    app.exec()
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure gui_client time to first paint")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child()
+        return
+
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not env.get("DISPLAY") and not env.get("WAYLAND_DISPLAY"):
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    results = {"imports": [], "window built": [], "first paint": [], "process total": []}
+    for _ in range(args.runs):
+        # Fresh process each run so import time is counted every time
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child"],
+                                capture_output=True, text=True, env=env, timeout=60,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        total = (time.perf_counter() - start) * 1000
+        try:
+            imports, built, painted = (float(x) for x in output.stdout.split())
+        except ValueError:
+            print(output.stderr)
+            sys.exit("[STARTUP] Child run failed")
+        results["imports"].append(imports)
+        results["window built"].append(built)
+        results["first paint"].append(painted)
+        results["process total"].append(total)
+
+    print(f"[STARTUP] {args.runs} runs, times from interpreter ready (process total includes Python startup and exit)")
+    for name, values in results.items():
+        print(f"[STARTUP] {name:<14} median {statistics.median(values):8.1f}ms  min {min(values):8.1f}ms  max {max(values):8.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+import os
+import struct
+import threading
+import queue
+import time
+
+# File layout: MAGIC, then records of HEADER + payload
+MAGIC = b"CHATCAP1"
+HEADER = struct.Struct("<dIBI") # timestamp, connection id, kind, payload length
+
+OPEN = 0
+DATA = 1
+CLOSE = 2
+SECRET = 3 # A password frame, the password itself is never written
+
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+class TrafficCapture:
+    """
+    Records inbound client bytes to an append-only file.
+    Passwords are not stored, the auth exchange records a SECRET marker in their
+    place. Other frames are stored as sent, so the file is created owner-only.
+    record_* calls only put a tuple on a queue, a background thread does the
+    packing and buffered writing so the client threads barely notice.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._queue = queue.SimpleQueue()
+        self._conn_ids = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._start = time.monotonic()
+
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        if hasattr(os, "fchmod"):
+            os.fchmod(fd, 0o600) # The mode above only applies to new files
+        self._file = os.fdopen(fd, "wb", buffering=WRITE_BUFFER_SIZE)
+        self._file.write(MAGIC)
+
+        self._writer = threading.Thread(target=self._writer_loop)
+        self._writer.daemon = True
+        self._writer.start()
+
+    def record_open(self, client):
+        with self._lock:
+            conn_id = self._next_id
+            self._next_id += 1
+            self._conn_ids[client] = conn_id
+        self._queue.put((time.monotonic() - self._start, conn_id, OPEN, b""))
+
+    def record_data(self, client, data):
+        conn_id = self._conn_ids.get(client)
+        if conn_id is not None and data:
+            self._queue.put((time.monotonic() - self._start, conn_id, DATA, data))
+
+    def record_secret(self, client):
+        conn_id = self._conn_ids.get(client)
+        if conn_id is not None:
+            self._queue.put((time.monotonic() - self._start, conn_id, SECRET, b""))
+
+    def record_close(self, client):
+        with self._lock:
+            conn_id = self._conn_ids.pop(client, None)
+        if conn_id is not None:
+            self._queue.put((time.monotonic() - self._start, conn_id, CLOSE, b""))
+
+    def _writer_loop(self):
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            timestamp, conn_id, kind, payload = record
+            self._file.write(HEADER.pack(timestamp, conn_id, kind, len(payload)))
+            self._file.write(payload)
+            # Only flush once we have caught up with the queue
+            if self._queue.empty():
+                self._file.flush()
+        self._file.flush()
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+
+def read_capture(path):
+    """Yields (timestamp, conn_id, kind, payload) for every record in a capture file"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                break # End of file (or a record cut off by a crash)
+            timestamp, conn_id, kind, length = HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            yield timestamp, conn_id, kind, payload
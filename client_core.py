@@ -1,12 +1,16 @@
 import socket
 import threading
 import json
+import os
+
+FILE_CHUNK_SIZE = 64 * 1024
 
 class ChatClient:
     def __init__(self):
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.connected = False
         self.receive_thread = None
+        self.host = None
 
     def connect(self, ip, port):
         """
@@ -15,6 +19,7 @@ class ChatClient:
         """
         try:
             self.sock.connect((ip, port))
+            self.host = ip
             self.connected = True
             return True, "Connected successfully"
         except Exception as e:
@@ -41,6 +46,107 @@ class ChatClient:
                 return False
         return False
 
+    def send_search(self, query, page=0):
+        """
+        Asks the server for one page of search results, answered with a
+        SEARCH_RESULTS packet. Ask for page + 1 while its "more" is True.
+        """
+        if self.connected:
+            try:
+                packet = {
+                    "type": "SEARCH",
+                    "content": query,
+                    "page": page
+                }
+                json_data = json.dumps(packet) + "\n"
+                self.sock.sendall(json_data.encode('utf-8'))
+                return True
+            except:
+                self.connected = False
+                return False
+        return False
+
+    def _send_control(self, packet):
+        if self.connected:
+            try:
+                self.sock.sendall((json.dumps(packet) + "\n").encode('utf-8'))
+                return True
+            except:
+                self.connected = False
+                return False
+        return False
+
+    def send_file_offer(self, target, transfer_id, name, size):
+        """
+        Asks the server to accept a file. Reusing a transfer_id resumes an
+        interrupted upload. The server answers with a FILE_READY packet.
+        """
+        return self._send_control({
+            "type": "FILE_OFFER",
+            "target": target,
+            "content": {"transfer_id": transfer_id, "name": name, "size": size}
+        })
+
+    def request_file(self, transfer_id):
+        """Asks the server for a download token, answered with FILE_READY"""
+        return self._send_control({"type": "FILE_GET", "content": transfer_id})
+
+    def _open_transfer(self, ready, offset):
+        sock = socket.create_connection((self.host, ready["port"]))
+        header = {"token": ready["token"], "offset": offset}
+        sock.sendall((json.dumps(header) + "\n").encode('utf-8'))
+        return sock
+
+    def upload_file(self, ready, path, progress_callback=None):
+        """
+        Streams a file over its own connection, starting at the offset the server
+        already has. Blocks until done, run it from a worker thread.
+        progress_callback(bytes_done, total) is called after every chunk.
+        """
+        offset = ready["offset"]
+        size = ready["size"]
+        sock = self._open_transfer(ready, offset)
+        try:
+            with open(path, 'rb') as f:
+                while offset < size:
+                    sent = sock.sendfile(f, offset, min(FILE_CHUNK_SIZE, size - offset))
+                    if not sent:
+                        raise ConnectionError("Upload interrupted")
+                    offset += sent
+                    if progress_callback:
+                        progress_callback(offset, size)
+        finally:
+            sock.close()
+
+    def download_file(self, ready, path, progress_callback=None):
+        """
+        Downloads a file into path. Data goes to path + ".part" first and is
+        renamed when complete, so an interrupted download to the same path picks
+        up where it left off while an existing file at path is simply replaced.
+        """
+        size = ready["size"]
+        part_path = path + ".part"
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset > size:
+            offset = 0
+
+        sock = self._open_transfer(ready, offset)
+        try:
+            with open(part_path, 'r+b' if offset else 'wb') as f:
+                f.seek(offset)
+                f.truncate()
+                while offset < size:
+                    chunk = sock.recv(min(FILE_CHUNK_SIZE, size - offset))
+                    if not chunk:
+                        raise ConnectionError("Download interrupted")
+                    f.write(chunk)
+                    offset += len(chunk)
+                    if progress_callback:
+                        progress_callback(offset, size)
+        finally:
+            sock.close()
+        os.replace(part_path, path)
+
     def receive_once(self):
         """Waits for one message (used during connection if needed)"""
         try:
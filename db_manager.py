@@ -1,16 +1,59 @@
 import sqlite3
+import time
+import queue
+import threading
 import bcrypt
 
 DB_NAME = "chat_users.db"
 
+# Search limits, these keep the cost of a single query bounded
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGES = 5
+SEARCH_MAX_TERMS = 8
+SEARCH_MAX_TERM_LENGTH = 64
+SEARCH_MAX_CANDIDATES = 5000 # Only the newest visible matches get ranked
+SEARCH_TIMEOUT = 2.0 # Seconds before a running search is interrupted
+
+# Messages are written by one background thread in batches
+MESSAGE_BATCH_SIZE = 500
+
+_message_queue = queue.Queue()
+_message_writer = None
+_message_writer_lock = threading.Lock()
+
 def initialize_database():
     conn = sqlite3.connect(DB_NAME)
     cursor = conn.cursor()
+    # WAL lets searches read while the message writer commits
+    cursor.execute("PRAGMA journal_mode=WAL")
     # Username is now the PRIMARY KEY. We don't care about IP for auth anymore.
     cursor.execute('''CREATE TABLE IF NOT EXISTS users(
         username TEXT PRIMARY KEY,
         password_hash BLOB
     )''')
+    cursor.execute('''CREATE TABLE IF NOT EXISTS messages(
+        id INTEGER PRIMARY KEY,
+        sender TEXT NOT NULL,
+        target TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp REAL NOT NULL
+    )''')
+    # Full-text index over message content. It is an external content table so the
+    # text is only stored once, the triggers keep it in sync as messages are written.
+    cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+        content,
+        content='messages',
+        content_rowid='id'
+    )''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+        INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);
+    END''')
+    cursor.execute('''CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+        INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+    END''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS messages_target ON messages(target)")
+    # Search scope looks up which groups a user has posted in
+    cursor.execute("CREATE INDEX IF NOT EXISTS messages_sender ON messages(sender, target)")
     conn.commit()
     conn.close()
 
@@ -50,4 +93,144 @@ def check_credentials(username, password_attempt):
         stored_hash = record[0]
         if bcrypt.checkpw(password_attempt.encode('utf-8'), stored_hash):
             return True
-    return False
\ No newline at end of file
+    return False
+
+def save_message(sender, target, content):
+    """
+    Queues a chat message for storage and returns straight away, so the caller
+    never waits on the disk. The FTS index is updated by the insert trigger.
+    Returns False (and stores nothing) if any field is not a string.
+    """
+    global _message_writer
+    if not all(isinstance(field, str) for field in (sender, target, content)):
+        return False
+    if _message_writer is None:
+        with _message_writer_lock:
+            if _message_writer is None:
+                _message_writer = threading.Thread(target=_message_writer_loop)
+                _message_writer.daemon = True
+                _message_writer.start()
+    _message_queue.put((sender, target, content, time.time()))
+    return True
+
+def flush_messages():
+    """Blocks until every queued message has been written"""
+    _message_queue.join()
+
+def _message_writer_loop():
+    conn = None
+    conn_name = None
+    while True:
+        # Wait for one message, then take whatever else is already queued
+        batch = [_message_queue.get()]
+        while len(batch) < MESSAGE_BATCH_SIZE:
+            try:
+                batch.append(_message_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if conn_name != DB_NAME:
+                # (Re)connect if DB_NAME was pointed somewhere else, e.g. by a benchmark
+                if conn:
+                    conn.close()
+                conn = None
+                conn = sqlite3.connect(DB_NAME)
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn_name = DB_NAME
+            _write_batch(conn, batch)
+        except Exception as e:
+            # Can't reach the database, drop this batch and try connecting again next time.
+            # Never let the thread die, flush_messages() would wait on it forever.
+            print(f"[DB ERROR] Could not save {len(batch)} messages: {e}")
+            conn_name = None
+        finally:
+            for _ in batch:
+                _message_queue.task_done()
+
+def _write_batch(conn, batch):
+    insert = "INSERT INTO messages (sender, target, content, timestamp) VALUES (?, ?, ?, ?)"
+    try:
+        conn.executemany(insert, batch)
+        conn.commit()
+        return
+    except sqlite3.Error:
+        conn.rollback()
+
+    # Something in the batch is bad, save row by row so only that row is lost
+    for row in batch:
+        try:
+            conn.execute(insert, row)
+            conn.commit()
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"[DB ERROR] Could not save message from {row[0]}: {e}")
+
+def build_search_query(text):
+    """
+    Turns free text into a safe FTS5 query.
+    Every word is quoted so user input can't use FTS operators, and the
+    number of terms is capped. Returns None if nothing is left to search for.
+    """
+    terms = []
+    for word in text.split():
+        word = word.replace('"', '')[:SEARCH_MAX_TERM_LENGTH]
+        if word:
+            terms.append(f'"{word}"')
+        if len(terms) == SEARCH_MAX_TERMS:
+            break
+    if not terms:
+        return None
+    return " ".join(terms)
+
+def search_messages(username, text, groups, page=0, page_size=SEARCH_PAGE_SIZE):
+    """
+    Searches messages the user can see: public messages, their own messages,
+    DMs they received, and messages in the given groups or in any group they
+    have posted in. Group membership is only kept in memory, so the posting
+    history is what keeps a group's history searchable after a reconnect.
+    Returns: (list_of_results, has_more, timed_out)
+    """
+    query = build_search_query(text)
+    if query is None or page < 0 or page >= SEARCH_MAX_PAGES:
+        return [], False, False
+    page_size = max(1, min(page_size, SEARCH_PAGE_SIZE))
+
+    conn = sqlite3.connect(DB_NAME)
+    # Returning True from the progress handler interrupts the query
+    deadline = time.monotonic() + SEARCH_TIMEOUT
+    conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT target FROM messages WHERE sender = ? AND target LIKE '#%'", (username,))
+        posted_groups = {row[0] for row in cursor.fetchall()}
+        visible = ["Everyone", username] + sorted(posted_groups.union(groups))
+        placeholders = ",".join("?" * len(visible))
+
+        # Rank only the newest visible matching rows so common words can't make a
+        # query sort the whole index. The scope is applied before the cap, otherwise
+        # a busy channel the user isn't in could fill it. One extra row is fetched
+        # to know if there is another page, and m.id breaks rank ties so pages are stable.
+        cursor.execute(f'''SELECT m.id, m.sender, m.target, m.content, m.timestamp
+            FROM (SELECT messages_fts.rowid AS rowid, messages_fts.rank AS rank
+                  FROM messages_fts
+                  JOIN messages v ON v.id = messages_fts.rowid
+                  WHERE messages_fts MATCH ?
+                    AND (v.target IN ({placeholders}) OR v.sender = ?)
+                  ORDER BY messages_fts.rowid DESC LIMIT ?) AS hits
+            JOIN messages m ON m.id = hits.rowid
+            ORDER BY hits.rank, m.id DESC
+            LIMIT ? OFFSET ?''',
+            [query] + visible + [username, SEARCH_MAX_CANDIDATES, page_size + 1, page * page_size])
+        rows = cursor.fetchall()
+    except sqlite3.Error:
+        # The progress handler interrupting the query also lands here
+        return [], False, time.monotonic() > deadline
+    finally:
+        conn.close()
+
+    has_more = len(rows) > page_size and page + 1 < SEARCH_MAX_PAGES
+    results = [
+        {"id": r[0], "sender": r[1], "target": r[2], "content": r[3], "timestamp": r[4]}
+        for r in rows[:page_size]
+    ]
+    return results, has_more, False
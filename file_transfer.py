@@ -0,0 +1,260 @@
+import os
+import json
+import secrets
+import socket
+import threading
+import time
+
+# Next to this file rather than the working directory, start() empties it
+STORAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "uploads")
+MAX_FILE_SIZE = 1024 * 1024 * 1024 # 1 GB
+CHUNK_SIZE = 64 * 1024
+HEADER_LIMIT = 4096
+
+# Limits so abandoned or abusive transfers can't pile up
+TOKEN_TTL = 60 # Seconds a FILE_READY token can be used for
+STALE_UPLOAD_TIMEOUT = 60 * 60 # Unfinished uploads idle this long are deleted
+FILE_RETENTION = 24 * 60 * 60 # Finished files are kept this long
+CLEANUP_INTERVAL = 60
+MAX_PENDING_UPLOADS_PER_USER = 3
+# Finished files still on disk count too, unfinished ones count at full size
+MAX_STORED_BYTES_PER_USER = 2 * MAX_FILE_SIZE
+
+class Transfer:
+    """One uploaded (or partially uploaded) file"""
+    def __init__(self, transfer_id, sender, target, name, size, path):
+        self.transfer_id = transfer_id
+        self.sender = sender
+        self.target = target
+        self.name = name
+        self.size = size
+        self.path = path
+        self.received = 0
+        self.uploading = False
+        self.updated = time.monotonic()
+
+    @property
+    def complete(self):
+        return self.received >= self.size
+
+    def info(self):
+        return {
+            "transfer_id": self.transfer_id,
+            "name": self.name,
+            "size": self.size,
+            "sender": self.sender,
+            "target": self.target
+        }
+
+def valid_transfer_id(transfer_id):
+    return isinstance(transfer_id, str) and 8 <= len(transfer_id) <= 64 and transfer_id.isalnum()
+
+class FileTransferServer:
+    """
+    File data goes over its own TCP connection on a separate port, so a big
+    upload never sits in front of chat frames on the chat socket.
+    The chat connection hands out one-time tokens (see offer/request_download),
+    the client then connects here and sends a single JSON header line:
+        {"token": "...", "offset": 123}
+    followed by the raw file bytes for an upload. Downloads are sent back
+    straight from disk with sendfile. Each transfer has its own socket, so TCP
+    flow control applies per transfer.
+    """
+    def __init__(self, host, port, storage_dir=STORAGE_DIR, on_upload_complete=None):
+        self.host = host
+        self.port = port
+        self.storage_dir = storage_dir
+        self.on_upload_complete = on_upload_complete
+
+        self.transfers = {}
+        self.tokens = {}
+        self.lock = threading.Lock()
+
+        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.running = False
+
+    def start(self):
+        os.makedirs(self.storage_dir, exist_ok=True)
+        # Transfers only live in memory, files left by an earlier run can't be reached.
+        # Only names this server could have written are removed, anything else is left alone.
+        for leftover in os.listdir(self.storage_dir):
+            path = os.path.join(self.storage_dir, leftover)
+            if not valid_transfer_id(leftover) or not os.path.isfile(path):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.server_socket.bind((self.host, self.port))
+        self.server_socket.listen()
+        self.server_socket.settimeout(1.0)
+        self.running = True
+        print(f"[FILES] File transfers on {self.host}:{self.port}")
+
+        thread = threading.Thread(target=self._accept_loop)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self.running = False
+        self.server_socket.close()
+
+    def _accept_loop(self):
+        last_cleanup = time.monotonic()
+        while self.running:
+            if time.monotonic() - last_cleanup > CLEANUP_INTERVAL:
+                self.cleanup()
+                last_cleanup = time.monotonic()
+            try:
+                connection, address = self.server_socket.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            thread = threading.Thread(target=self.handle_connection, args=(connection,))
+            thread.daemon = True
+            thread.start()
+
+    def cleanup(self):
+        """Drops expired tokens, idle unfinished uploads and finished files past retention"""
+        now = time.monotonic()
+        with self.lock:
+            self.tokens = {token: entry for token, entry in self.tokens.items() if entry[3] > now}
+            expired = [
+                transfer for transfer in self.transfers.values()
+                if not transfer.uploading and (
+                    # Offered but never started, gone once its token can't be used any more
+                    (transfer.received == 0 and now - transfer.updated > TOKEN_TTL)
+                    or (not transfer.complete and now - transfer.updated > STALE_UPLOAD_TIMEOUT)
+                    or (transfer.complete and now - transfer.updated > FILE_RETENTION))
+            ]
+            for transfer in expired:
+                del self.transfers[transfer.transfer_id]
+
+        for transfer in expired:
+            try:
+                os.remove(transfer.path)
+            except OSError:
+                pass
+
+    def _new_token(self, transfer, mode, username):
+        token = secrets.token_hex(16)
+        with self.lock:
+            self.tokens[token] = (transfer, mode, username, time.monotonic() + TOKEN_TTL)
+        return token
+
+    def offer(self, sender, target, transfer_id, name, size):
+        """
+        Starts or resumes an upload.
+        Returns: (ready_dict, None) or (None, error_message)
+        """
+        if not valid_transfer_id(transfer_id):
+            return None, "Invalid transfer id."
+        if not isinstance(size, int) or size <= 0 or size > MAX_FILE_SIZE:
+            return None, "File is empty or too large."
+
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+            if transfer is None:
+                stored = [t for t in self.transfers.values() if t.sender == sender]
+                if sum(1 for t in stored if not t.complete) >= MAX_PENDING_UPLOADS_PER_USER:
+                    return None, "Too many unfinished uploads, finish or wait for them to expire."
+                if sum(t.size for t in stored) + size > MAX_STORED_BYTES_PER_USER:
+                    return None, "You have too much file data stored, wait for older files to expire."
+                # Stored under the transfer id, the user supplied name is only for display
+                path = os.path.join(self.storage_dir, transfer_id)
+                transfer = Transfer(transfer_id, sender, target, os.path.basename(str(name)), size, path)
+                self.transfers[transfer_id] = transfer
+            elif transfer.sender != sender or transfer.size != size:
+                return None, "Transfer id already in use."
+            elif transfer.complete:
+                return None, "File already uploaded."
+            elif transfer.uploading:
+                return None, "Upload already in progress."
+
+        token = self._new_token(transfer, "upload", sender)
+        return {
+            "transfer_id": transfer_id,
+            "mode": "upload",
+            "token": token,
+            "offset": transfer.received,
+            "size": transfer.size,
+            "port": self.port
+        }, None
+
+    def request_download(self, username, transfer_id, can_see):
+        """
+        can_see(transfer) decides if the user is allowed to fetch it.
+        Returns: (ready_dict, None) or (None, error_message)
+        """
+        with self.lock:
+            transfer = self.transfers.get(transfer_id)
+        if transfer is None or not transfer.complete or not can_see(transfer):
+            return None, "File not found."
+
+        token = self._new_token(transfer, "download", username)
+        return {
+            "transfer_id": transfer_id,
+            "mode": "download",
+            "token": token,
+            "name": transfer.name,
+            "size": transfer.size,
+            "port": self.port
+        }, None
+
+    def handle_connection(self, connection):
+        try:
+            connection.settimeout(30.0)
+            rfile = connection.makefile('rb')
+            header = json.loads(rfile.readline(HEADER_LIMIT).decode('utf-8'))
+
+            with self.lock:
+                entry = self.tokens.pop(header.get('token'), None)
+            if entry is None or entry[3] < time.monotonic():
+                return
+            transfer, mode, username, expires = entry
+            offset = header.get('offset', 0)
+
+            if mode == "upload":
+                self.receive_upload(rfile, transfer, offset)
+            else:
+                self.send_download(connection, transfer, offset)
+        except Exception as e:
+            print(f"[FILES ERROR] {e}")
+        finally:
+            connection.close()
+
+    def receive_upload(self, rfile, transfer, offset):
+        with self.lock:
+            if transfer.uploading or offset != transfer.received:
+                return
+            transfer.uploading = True
+
+        try:
+            mode = 'r+b' if os.path.exists(transfer.path) else 'wb'
+            with open(transfer.path, mode) as f:
+                f.seek(offset)
+                f.truncate()
+                while transfer.received < transfer.size:
+                    chunk = rfile.read1(min(CHUNK_SIZE, transfer.size - transfer.received))
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                    transfer.received += len(chunk)
+                    transfer.updated = time.monotonic()
+        finally:
+            transfer.uploading = False
+            transfer.updated = time.monotonic()
+
+        if transfer.complete:
+            print(f"[FILES] {transfer.sender} uploaded {transfer.name} ({transfer.size} bytes)")
+            if self.on_upload_complete:
+                self.on_upload_complete(transfer)
+
+    def send_download(self, connection, transfer, offset):
+        if not isinstance(offset, int) or offset < 0 or offset > transfer.size:
+            return
+        with open(transfer.path, 'rb') as f:
+            # socket.sendfile uses os.sendfile where available, so the data never enters Python
+            connection.sendfile(f, offset, transfer.size - offset)
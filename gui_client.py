@@ -1,21 +1,49 @@
 import sys
 import os
-import json
 from PyQt6.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton, 
-                             QLineEdit, QTextEdit, QLabel, QStackedLayout, QMessageBox, 
-                             QHBoxLayout, QListWidget, QFrame, QSplitter) 
+                             QLineEdit, QTextBrowser, QLabel, QStackedLayout, QMessageBox, 
+                             QHBoxLayout, QListWidget, QListWidgetItem,
+                             QFileDialog, QProgressBar) 
 from PyQt6.QtCore import QThread, pyqtSignal, Qt
-from PyQt6.QtGui import QFont, QIcon, QPixmap
+from PyQt6.QtGui import QIcon, QPixmap
 
-from client_core import ChatClient 
+# client_core (sockets, threads) and secrets are imported where they are used,
+# nothing before the login screen needs them
 
 DEFAULT_IP = "127.0.0.1"
 DEFAULT_PORT = 65432
 
+# The full size logo is 960x960, the app only ever shows it at 120px
+LOGO_PATH = "Python Chat Application Logo 120.png"
+LOGO_FULL_PATH = "Python Chat Application Logo.png"
+LOGO_SIZE = 120
+
 def resource_path(relative_path):
     base_path = getattr(sys, '_MEIPASS', os.path.abspath("."))
     return os.path.join(base_path, relative_path)
 
+_logo_cache = None
+
+def load_logo():
+    """Decodes the logo once, the window icon and login screen share it"""
+    global _logo_cache
+    if _logo_cache is None:
+        pixmap = QPixmap(resource_path(LOGO_PATH))
+        if pixmap.isNull():
+            # Pre-scaled copy missing (e.g. an older build), fall back to the big one
+            pixmap = QPixmap(resource_path(LOGO_FULL_PATH))
+            if not pixmap.isNull():
+                pixmap = pixmap.scaled(LOGO_SIZE, LOGO_SIZE, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
+        _logo_cache = pixmap
+    return _logo_cache
+
+def format_size(size):
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GB"
+
 STYLESHEET = """
     QWidget { background-color: #1e1e1e; color: #e0e0e0; font-family: 'Segoe UI'; font-size: 14px; }
     
@@ -58,6 +86,7 @@ class ChatWorker(QThread):
 
     def __init__(self, host, port):
         super().__init__()
+        from client_core import ChatClient
         self.client = ChatClient() 
         self.host = host
         self.port = port
@@ -76,9 +105,43 @@ class ChatWorker(QThread):
     def send_message(self, target, msg):
         self.client.send_message(target, msg)
 
+    def send_search(self, query, page=0):
+        self.client.send_search(query, page)
+
+    def send_file_offer(self, target, transfer_id, name, size):
+        self.client.send_file_offer(target, transfer_id, name, size)
+
+    def request_file(self, transfer_id):
+        self.client.request_file(transfer_id)
+
     def stop(self):
         self.client.close()
 
+class FileTransferWorker(QThread):
+    """Runs one upload or download on its own connection so the UI stays responsive"""
+    progress = pyqtSignal(str, int) # transfer_id, percent
+    finished_transfer = pyqtSignal(str, bool, str) # transfer_id, success, error
+
+    def __init__(self, client, ready, path):
+        super().__init__()
+        self.client = client
+        self.ready = ready
+        self.path = path
+        self.transfer_id = ready["transfer_id"]
+
+    def run(self):
+        try:
+            if self.ready["mode"] == "upload":
+                self.client.upload_file(self.ready, self.path, self.report_progress)
+            else:
+                self.client.download_file(self.ready, self.path, self.report_progress)
+            self.finished_transfer.emit(self.transfer_id, True, "")
+        except Exception as e:
+            self.finished_transfer.emit(self.transfer_id, False, str(e))
+
+    def report_progress(self, done, total):
+        self.progress.emit(self.transfer_id, int(done * 100 / total))
+
 class ChatWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -97,13 +160,19 @@ class ChatWindow(QWidget):
             self.chat_history[g] = ""
 
         self.worker = None 
+        self.current_search = None
+
+        # File transfers: transfer_id -> info dict / running FileTransferWorker
+        self.pending_uploads = {}
+        self.pending_downloads = {}
+        self.file_workers = {}
         
+        # Only the login screen is built up front, the chat UI waits for a connection
+        self.chat_widget = None
         self.init_login_ui()
-        self.init_chat_ui()
         self.setLayout(self.stack)
         
-        icon_path = resource_path("Python Chat Application logo.png")
-        self.setWindowIcon(QIcon(icon_path))
+        self.setWindowIcon(QIcon(load_logo()))
 
     def init_login_ui(self):
         # (Unchanged Login UI code for brevity, same as before)
@@ -113,11 +182,9 @@ class ChatWindow(QWidget):
         layout.setContentsMargins(40, 40, 40, 40)
         
         logo_label = QLabel()
-        logo_path = resource_path("Python Chat Application logo.png")
-        pixmap = QPixmap(logo_path)
+        pixmap = load_logo()
         if not pixmap.isNull():
-            scaled = pixmap.scaled(120, 120, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
-            logo_label.setPixmap(scaled)
+            logo_label.setPixmap(pixmap)
             logo_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
             layout.addWidget(logo_label)
         
@@ -156,6 +223,19 @@ class ChatWindow(QWidget):
         left_lbl.setProperty("class", "header")
         left_panel.addWidget(left_lbl)
         
+        # Search box, results stream into the list below it page by page
+        self.search_input = QLineEdit()
+        self.search_input.setFixedWidth(200)
+        self.search_input.setPlaceholderText("Search messages...")
+        self.search_input.returnPressed.connect(self.start_search)
+        left_panel.addWidget(self.search_input)
+
+        self.search_results = QListWidget()
+        self.search_results.setFixedWidth(200)
+        self.search_results.itemClicked.connect(self.open_search_result)
+        self.search_results.hide()
+        left_panel.addWidget(self.search_results)
+
         self.contact_list = QListWidget()
         self.contact_list.setFixedWidth(200) # Fixed width for sidebar
         self.contact_list.itemClicked.connect(self.switch_chat) # Click to switch
@@ -175,8 +255,10 @@ class ChatWindow(QWidget):
         self.chat_title.setStyleSheet("font-size: 18px; font-weight: bold; color: white; margin-bottom: 10px;")
         mid_panel.addWidget(self.chat_title)
 
-        self.chat_area = QTextEdit()
-        self.chat_area.setReadOnly(True)
+        # QTextBrowser so file links in the chat can be clicked
+        self.chat_area = QTextBrowser()
+        self.chat_area.setOpenLinks(False)
+        self.chat_area.anchorClicked.connect(self.download_link)
         self.chat_area.setStyleSheet("border: none; background-color: #252525; color: white;") 
         mid_panel.addWidget(self.chat_area)
         
@@ -191,8 +273,22 @@ class ChatWindow(QWidget):
         self.send_btn.setFixedWidth(80)
         self.send_btn.clicked.connect(self.send_text)
         input_layout.addWidget(self.send_btn)
+
+        self.attach_btn = QPushButton("ATTACH")
+        self.attach_btn.setFixedWidth(90)
+        self.attach_btn.clicked.connect(self.attach_file)
+        input_layout.addWidget(self.attach_btn)
         
         mid_panel.addLayout(input_layout)
+
+        # Transfer progress, hidden while nothing is transferring
+        self.transfer_label = QLabel()
+        self.transfer_progress = QProgressBar()
+        self.transfer_progress.setRange(0, 100)
+        self.transfer_label.hide()
+        self.transfer_progress.hide()
+        mid_panel.addWidget(self.transfer_label)
+        mid_panel.addWidget(self.transfer_progress)
         main_layout.addLayout(mid_panel, stretch=1) # Stretch=1 means this takes available space
         
         # --- RIGHT PANEL (Active Users) ---
@@ -230,6 +326,8 @@ class ChatWindow(QWidget):
 
     def handle_connection_result(self, success, message):
         if success:
+            if self.chat_widget is None:
+                self.init_chat_ui()
             self.stack.setCurrentWidget(self.chat_widget)
             # Select #General by default
             self.contact_list.setCurrentRow(0)
@@ -269,6 +367,66 @@ class ChatWindow(QWidget):
         self.contact_list.setCurrentItem(items[0])
         self.switch_chat(items[0])
 
+    def start_search(self):
+        query = self.search_input.text().strip()
+        self.search_results.clear()
+        if not query:
+            self.current_search = None
+            self.search_results.hide()
+            return
+
+        self.current_search = query
+        self.search_results.show()
+        if self.worker:
+            self.worker.send_search(query)
+
+    def open_search_result(self, item):
+        """Called when user clicks a search result, jumps to the chat it came from"""
+        next_page = item.data(Qt.ItemDataRole.UserRole + 1)
+        if next_page is not None:
+            # "More results" entry, only now ask the server for the next page
+            self.search_results.takeItem(self.search_results.row(item))
+            if self.worker and self.current_search:
+                self.worker.send_search(self.current_search, next_page)
+            return
+        chat_key = item.data(Qt.ItemDataRole.UserRole)
+        if not chat_key:
+            return
+        items = self.contact_list.findItems(chat_key, Qt.MatchFlag.MatchExactly)
+        if not items:
+            self.contact_list.addItem(chat_key)
+            items = self.contact_list.findItems(chat_key, Qt.MatchFlag.MatchExactly)
+        self.contact_list.setCurrentItem(items[0])
+        self.switch_chat(items[0])
+
+    def show_search_page(self, page):
+        # Ignore pages from an older search
+        if page.get("query") != self.current_search:
+            return
+
+        for result in page.get("results", []):
+            target = result.get("target")
+            sender = result.get("sender")
+            if target == "Everyone":
+                chat_key = "#General"
+            elif target == self.my_username:
+                chat_key = sender
+            else:
+                chat_key = target
+
+            item = QListWidgetItem(f"{chat_key} - {sender}: {result.get('content', '')}")
+            item.setData(Qt.ItemDataRole.UserRole, chat_key)
+            self.search_results.addItem(item)
+
+        if page.get("timed_out"):
+            self.search_results.addItem("Search timed out, try more specific words")
+        elif page.get("more"):
+            item = QListWidgetItem("More results...")
+            item.setData(Qt.ItemDataRole.UserRole + 1, page.get("page", 0) + 1)
+            self.search_results.addItem(item)
+        elif self.search_results.count() == 0:
+            self.search_results.addItem("No results")
+
     def process_message(self, msg_dict):
         type = msg_dict.get("type")
         content = msg_dict.get("content", "")
@@ -280,19 +438,31 @@ class ChatWindow(QWidget):
             self.append_to_history("#General", f"<div style='color:green'><i>Logged in as {content}</i></div>")
             return
 
-        # 2. Handle User List
+        # 2. Handle Search Results (one packet per page)
+        elif type == "SEARCH_RESULTS":
+            self.show_search_page(content)
+
+        # 3. Handle File Transfer Tokens
+        elif type == "FILE_READY":
+            self.start_file_transfer(content)
+
+        # 4. Handle User List
         elif type == "USER_LIST":
             self.active_users_list.clear()
             for user in content:
                 if not user.startswith("#") and user != "Everyone": 
                     self.active_users_list.addItem(user)
                     
-        # 3. Handle System Messages
+        # 5. Handle System Messages
         elif type == "SYSTEM":
             self.append_to_history(self.current_chat, f"<div style='color:#888'><i>[SYSTEM]: {content}</i></div>")
 
-        # 4. Handle Chat Messages
-        elif type == "CHAT":
+        # 6. Handle Chat Messages (and files, which are shown as a download link)
+        elif type in ("CHAT", "FILE"):
+            if type == "FILE":
+                content = (f"📎 <a href='transfer:{content.get('transfer_id')}' style='color:#4a90e2'>"
+                           f"{content.get('name')}</a> ({format_size(content.get('size', 0))})")
+
             is_private = msg_dict.get("is_private", False)
             target_group = msg_dict.get("target_group", None)
             
@@ -340,6 +510,89 @@ class ChatWindow(QWidget):
                     alert = f"<div style='color:#ff66b2'><i>🔔 New Message from {sender} in {chat_key}</i></div>"
                     self.chat_area.append(alert)
                     
+    def attach_file(self):
+        path, _ = QFileDialog.getOpenFileName(self, "Send File")
+        if not path or not self.worker:
+            return
+        size = os.path.getsize(path)
+        if size == 0:
+            QMessageBox.warning(self, "Send File", "File is empty.")
+            return
+
+        import secrets
+        transfer_id = secrets.token_hex(8)
+        name = os.path.basename(path)
+        self.pending_uploads[transfer_id] = {"path": path, "target": self.current_chat, "name": name, "size": size, "retries": 0}
+        self.worker.send_file_offer(self.current_chat, transfer_id, name, size)
+
+    def download_link(self, url):
+        """Called when user clicks a file link in the chat"""
+        link = url.toString()
+        if not link.startswith("transfer:") or not self.worker:
+            return
+        transfer_id = link.split(":", 1)[1]
+        if transfer_id in self.pending_downloads:
+            return # Already requested or downloading, a second click would start a second download
+        self.pending_downloads[transfer_id] = None
+        self.worker.request_file(transfer_id)
+
+    def start_file_transfer(self, ready):
+        transfer_id = ready.get("transfer_id")
+        if transfer_id in self.file_workers:
+            return # Only one worker per transfer, both would write the same file
+        if ready.get("mode") == "upload":
+            upload = self.pending_uploads.get(transfer_id)
+            if not upload:
+                return
+            path, name = upload["path"], upload["name"]
+        else:
+            if transfer_id not in self.pending_downloads:
+                return
+            path = self.pending_downloads[transfer_id]
+            name = ready.get("name", "file")
+            if path is None:
+                path, _ = QFileDialog.getSaveFileName(self, "Save File", name)
+                if not path:
+                    del self.pending_downloads[transfer_id]
+                    return
+                self.pending_downloads[transfer_id] = path
+
+        worker = FileTransferWorker(self.worker.client, ready, path)
+        worker.progress.connect(self.update_transfer_progress)
+        worker.finished_transfer.connect(self.finish_file_transfer)
+        self.file_workers[transfer_id] = worker
+
+        verb = "Uploading" if ready.get("mode") == "upload" else "Downloading"
+        self.transfer_label.setText(f"{verb} {name}...")
+        self.transfer_progress.setValue(int(ready.get("offset", 0) * 100 / max(ready.get("size", 1), 1)))
+        self.transfer_label.show()
+        self.transfer_progress.show()
+        worker.start()
+
+    def update_transfer_progress(self, transfer_id, percent):
+        self.transfer_progress.setValue(percent)
+
+    def finish_file_transfer(self, transfer_id, success, error):
+        self.file_workers.pop(transfer_id, None)
+        upload = self.pending_uploads.get(transfer_id)
+
+        if not success and upload and upload["retries"] < 3 and self.worker:
+            # Offer the same transfer id again, the server resumes where it stopped
+            upload["retries"] += 1
+            self.worker.send_file_offer(upload["target"], transfer_id, upload["name"], upload["size"])
+            return
+
+        self.pending_uploads.pop(transfer_id, None)
+        path = self.pending_downloads.pop(transfer_id, None)
+        if success and path:
+            self.append_to_history(self.current_chat, f"<div style='color:#888'><i>[SYSTEM]: Saved to {path}</i></div>")
+        elif not success:
+            self.append_to_history(self.current_chat, f"<div style='color:#888'><i>[SYSTEM]: File transfer failed: {error}</i></div>")
+
+        if not self.file_workers:
+            self.transfer_label.hide()
+            self.transfer_progress.hide()
+
     def append_to_history(self, chat_key, html_content):
         # 1. Ensure key exists
         if chat_key not in self.chat_history:
@@ -0,0 +1,164 @@
+import json
+import socket
+import threading
+import time
+from collections import deque
+
+# Priority lanes, lower goes first
+CONTROL = 0
+CHAT = 1
+BULK = 2
+
+# Packet types that ride in the chat and bulk lanes, everything else is control
+CHAT_TYPES = {"CHAT", "FILE"}
+BULK_TYPES = {"SEARCH_RESULTS"}
+
+MAX_CHAT_BACKLOG = 1000 # Older chat frames are shed past this
+MAX_CONTROL_BACKLOG = 10000 # Past this the client is too slow and gets dropped
+MAX_BULK_BACKLOG = 100 # Replies the client asked for, so never shed, but past this it gets dropped
+BATCH_BYTES = 64 * 1024
+# Keep the kernel send buffer small, bytes already in it can't be reordered,
+# so a big buffer would just be another FIFO in front of control frames
+SEND_BUFFER_SIZE = 64 * 1024
+CLOSE_TIMEOUT = 2.0
+SHED_NOTICE_INTERVAL = 1.0 # At most one "messages dropped" notice per second
+
+def priority_for(packet_type):
+    if packet_type in CHAT_TYPES:
+        return CHAT
+    if packet_type in BULK_TYPES:
+        return BULK
+    return CONTROL
+
+class ClientConnection:
+    """
+    Wraps a client socket with a three lane outbound queue.
+    Any thread can send() without blocking, a writer thread drains the control
+    lane first, then the chat lane, then the bulk lane, so auth prompts, user
+    lists and admin messages never wait behind chat fan-out, and large search
+    replies never hold up either. Each batch still carries one bulk frame so a
+    steady chat flood can't starve a reply forever. When a client can't keep up
+    the oldest chat frames are dropped instead of growing memory, and the client
+    gets a SYSTEM notice on the control lane saying how many were dropped.
+    """
+    def __init__(self, sock, max_chat_backlog=MAX_CHAT_BACKLOG):
+        self.sock = sock
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SEND_BUFFER_SIZE)
+        except OSError:
+            pass
+        self.control = deque()
+        self.chat = deque(maxlen=max_chat_backlog)
+        self.bulk = deque()
+        self.shed = 0
+        self.unreported_shed = 0
+        self.last_shed_notice = 0.0
+        self.closing = False
+        self.cond = threading.Condition()
+
+        self.writer = threading.Thread(target=self._writer_loop)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def recv(self, bufsize):
+        return self.sock.recv(bufsize)
+
+    def send(self, data, priority=CONTROL):
+        with self.cond:
+            if self.closing:
+                return
+            if priority == CONTROL:
+                if len(self.control) >= MAX_CONTROL_BACKLOG:
+                    # Unblocks the reader thread, which then cleans the client up
+                    self._abort()
+                    return
+                self.control.append(data)
+            elif priority == BULK:
+                if len(self.bulk) >= MAX_BULK_BACKLOG:
+                    self._abort()
+                    return
+                self.bulk.append(data)
+            else:
+                if len(self.chat) == self.chat.maxlen:
+                    self.shed += 1
+                    self.unreported_shed += 1
+                self.chat.append(data)
+            self.cond.notify()
+
+    def _next_batch(self):
+        """
+        Called with the lock held. All pending control frames, then chat frames
+        up to BATCH_BYTES, then bulk frames (at least one) up to BATCH_BYTES.
+        """
+        batch = []
+        size = 0
+        notice_due = self.closing or time.monotonic() - self.last_shed_notice >= SHED_NOTICE_INTERVAL
+        if self.unreported_shed and notice_due:
+            batch.append(self._shed_notice(self.unreported_shed))
+            self.unreported_shed = 0
+            self.last_shed_notice = time.monotonic()
+        while self.control:
+            frame = self.control.popleft()
+            batch.append(frame)
+            size += len(frame)
+        while self.chat and size < BATCH_BYTES:
+            frame = self.chat.popleft()
+            batch.append(frame)
+            size += len(frame)
+        if self.bulk:
+            frame = self.bulk.popleft()
+            batch.append(frame)
+            size += len(frame)
+        while self.bulk and size < BATCH_BYTES:
+            frame = self.bulk.popleft()
+            batch.append(frame)
+            size += len(frame)
+        return b"".join(batch)
+
+    def _shed_notice(self, count):
+        packet = {
+            "type": "SYSTEM",
+            "sender": "Server",
+            "content": f"{count} messages were dropped because your connection fell behind. Use search to find them.",
+            "is_private": False,
+            "target_group": None
+        }
+        return (json.dumps(packet) + "\n").encode('utf-8')
+
+    def _writer_loop(self):
+        while True:
+            with self.cond:
+                while not self.control and not self.chat and not self.bulk and not self.closing:
+                    if self.unreported_shed:
+                        # Nothing queued but a drop notice is still owed, send it when due
+                        wait = self.last_shed_notice + SHED_NOTICE_INTERVAL - time.monotonic()
+                        if wait <= 0:
+                            break
+                        self.cond.wait(wait)
+                    else:
+                        self.cond.wait()
+                if not self.control and not self.chat and not self.bulk and not self.unreported_shed:
+                    break # Closing and nothing left to send
+                data = self._next_batch()
+            try:
+                self.sock.sendall(data)
+            except:
+                self._abort()
+                break
+
+    def _abort(self):
+        # shutdown() first so a thread blocked in recv() wakes up
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
+        self.sock.close()
+
+    def close(self):
+        """Lets the writer flush what is queued (up to CLOSE_TIMEOUT), then closes the socket"""
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        if threading.current_thread() is not self.writer:
+            self.writer.join(CLOSE_TIMEOUT)
+        self._abort()
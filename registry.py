@@ -0,0 +1,97 @@
+import threading
+
+class ClientRegistry:
+    """
+    Username -> connection map that is safe to read from any thread.
+    Writers take the lock and publish a new snapshot, readers just grab the
+    current snapshot and never see it change under them.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._clients = {}
+        self._connections = ()
+
+    def _publish(self, clients):
+        # Build everything first, then swap the references in
+        self._connections = tuple(clients.values())
+        self._clients = clients
+
+    def add(self, username, client):
+        with self._lock:
+            clients = dict(self._clients)
+            clients[username] = client
+            self._publish(clients)
+
+    def remove(self, username, client=None):
+        """
+        Removes a user. If client is given, only removes the entry if it is still
+        that connection (so an old connection can't remove a newer login).
+        Returns True if something was removed.
+        """
+        with self._lock:
+            current = self._clients.get(username)
+            if current is None or (client is not None and current is not client):
+                return False
+            clients = dict(self._clients)
+            del clients[username]
+            self._publish(clients)
+            return True
+
+    def get(self, username):
+        return self._clients.get(username)
+
+    def snapshot(self):
+        """Current username -> connection map. Do not modify it."""
+        return self._clients
+
+    def connections(self):
+        """Tuple of all connections, ready to iterate without copying."""
+        return self._connections
+
+    def names(self):
+        return list(self._clients)
+
+    def __contains__(self, username):
+        return username in self._clients
+
+    def __len__(self):
+        return len(self._clients)
+
+
+class GroupRegistry:
+    """
+    Group name -> members map using the same copy-on-write scheme as ClientRegistry.
+    Members are stored as frozensets so a snapshot can be iterated safely.
+    """
+    def __init__(self, group_names):
+        self._lock = threading.Lock()
+        self._groups = {name: frozenset() for name in group_names}
+
+    def join(self, group, username):
+        """Adds a user to an existing group. Returns False if the group doesn't exist."""
+        with self._lock:
+            members = self._groups.get(group)
+            if members is None:
+                return False
+            if username not in members:
+                groups = dict(self._groups)
+                groups[group] = members | {username}
+                self._groups = groups
+            return True
+
+    def leave_all(self, username):
+        with self._lock:
+            groups = {name: members - {username} for name, members in self._groups.items()}
+            self._groups = groups
+
+    def members(self, group):
+        return self._groups.get(group, frozenset())
+
+    def groups_of(self, username):
+        return [name for name, members in self._groups.items() if username in members]
+
+    def names(self):
+        return list(self._groups)
+
+    def __contains__(self, group):
+        return group in self._groups
@@ -0,0 +1,160 @@
+import argparse
+import json
+import socket
+import threading
+import time
+
+from capture import read_capture, OPEN, DATA, CLOSE, SECRET
+
+class ReplayConnection:
+    """One replayed client. A reader thread drains whatever the server sends back."""
+    def __init__(self, host, port):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.connect((host, port))
+        self.received = 0
+        self.reader = threading.Thread(target=self._drain)
+        self.reader.daemon = True
+        self.reader.start()
+
+    def _drain(self):
+        # The server blocks in sendall if nobody reads, so always keep reading
+        try:
+            while True:
+                data = self.sock.recv(65536)
+                if not data:
+                    break
+                self.received += len(data)
+        except:
+            pass
+
+    def send(self, data):
+        self.sock.sendall(data)
+
+    def close(self):
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except:
+            pass
+        self.sock.close()
+
+def replay(path, host, port, speed, password=""):
+    """
+    Re-drives a capture against a server.
+    speed: 1 for real time, N for N times faster, 0 for as fast as possible.
+    password: sent wherever the capture has a SECRET (password) marker.
+    Returns a dict of stats.
+    """
+    secret_frame = (json.dumps({"target": "Everyone", "content": password}) + "\n").encode('utf-8')
+    connections = {}
+    stats = {"connections": 0, "frames": 0, "bytes_sent": 0, "errors": 0}
+    start = time.monotonic()
+    first_timestamp = None
+
+    for timestamp, conn_id, kind, payload in read_capture(path):
+        if speed > 0:
+            if first_timestamp is None:
+                first_timestamp = timestamp
+            delay = (timestamp - first_timestamp) / speed - (time.monotonic() - start)
+            if delay > 0:
+                time.sleep(delay)
+
+        try:
+            if kind == OPEN:
+                connections[conn_id] = ReplayConnection(host, port)
+                stats["connections"] += 1
+            elif kind == DATA and conn_id in connections:
+                connections[conn_id].send(payload)
+                stats["frames"] += 1
+                stats["bytes_sent"] += len(payload)
+            elif kind == SECRET and conn_id in connections:
+                connections[conn_id].send(secret_frame)
+                stats["frames"] += 1
+            elif kind == CLOSE and conn_id in connections:
+                connections.pop(conn_id).close()
+        except OSError:
+            stats["errors"] += 1
+            connection = connections.pop(conn_id, None)
+            if connection:
+                connection.close()
+
+    for connection in connections.values():
+        connection.close()
+
+    stats["elapsed"] = time.monotonic() - start
+    return stats
+
+def captured_logins(path):
+    """
+    Usernames that log in to an existing account somewhere in the capture.
+    Accounts the capture registers itself are left out, replaying their
+    registration creates them.
+    """
+    auth_frames = {}
+    logins = set()
+    registered = set()
+    for timestamp, conn_id, kind, payload in read_capture(path):
+        if kind == OPEN:
+            auth_frames[conn_id] = []
+        elif kind == DATA and conn_id in auth_frames:
+            auth_frames[conn_id].append(payload)
+        elif kind == SECRET and conn_id in auth_frames:
+            # The auth exchange is choice, username, password, and each is recorded as its own frame
+            frames = auth_frames.pop(conn_id)
+            if len(frames) < 2:
+                continue
+            try:
+                choice = json.loads(frames[0]).get('content', '').strip().lower()
+                username = json.loads(frames[1]).get('content', '').strip()
+            except (ValueError, AttributeError):
+                continue
+            if choice in ('1', 'login') and username not in registered:
+                logins.add(username)
+            elif choice in ('2', 'register'):
+                registered.add(username)
+        elif kind == CLOSE:
+            auth_frames.pop(conn_id, None)
+    return logins
+
+def seed_database(path, db_path, password):
+    """
+    Registers every account the capture logs in to with the substitute
+    password, so replayed logins succeed against db_path.
+    Returns: (created, already_there)
+    """
+    import db_manager # Needs bcrypt, only the seeding step uses it
+    db_manager.DB_NAME = db_path
+    db_manager.initialize_database()
+    created = already_there = 0
+    for username in sorted(captured_logins(path)):
+        if db_manager.register_user(username, password):
+            created += 1
+        else:
+            already_there += 1
+    return created, already_there
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a captured traffic file against a chat server")
+    parser.add_argument("capture", help="file written by server.py --capture")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=65432)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="1 = real time, N = N times faster, 0 = max speed")
+    parser.add_argument("--password", default="",
+                        help="password to send for every login, captures never contain passwords")
+    parser.add_argument("--seed-db", metavar="PATH",
+                        help="register the capture's users in this database with --password, then exit")
+    args = parser.parse_args()
+
+    if args.seed_db:
+        created, already_there = seed_database(args.capture, args.seed_db, args.password)
+        print(f"[SEED] {created} users added to {args.seed_db} ({already_there} already existed)")
+        return
+
+    print(f"[REPLAY] {args.capture} -> {args.host}:{args.port} at "
+          f"{'max speed' if args.speed <= 0 else f'{args.speed:g}x'}")
+    stats = replay(args.capture, args.host, args.port, args.speed, args.password)
+    print(f"[REPLAY] {stats['connections']} connections, {stats['frames']} frames, "
+          f"{stats['bytes_sent']:,} bytes in {stats['elapsed']:.2f}s ({stats['errors']} errors)")
+
+if __name__ == "__main__":
+    main()
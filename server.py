@@ -1,22 +1,41 @@
 import socket 
 import threading
 import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 import db_manager
+from capture import TrafficCapture
+from file_transfer import FileTransferServer, STORAGE_DIR
+from registry import ClientRegistry, GroupRegistry
+from outbound import ClientConnection, priority_for
+
+SEARCH_WORKERS = 4
 
 class ChatServer: 
-    def __init__(self, host, port):
+    def __init__(self, host, port, capture_path=None, storage_dir=STORAGE_DIR):
         self.host = host
         self.port = port 
         self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         
-        self.clients = {}
-        self.groups = {
-            "#General": [],
-            "#Gamers": [],
-            "#Coders": []
-        }
+        # Copy-on-write registries, readers iterate snapshots without locking
+        self.clients = ClientRegistry()
+        self.groups = GroupRegistry(["#General", "#Gamers", "#Coders"])
         
+        # Searches run here instead of on the client's reader thread.
+        # Each connection has at most one search running, a newer request
+        # replaces one still waiting so the pool's queue can't grow unbounded.
+        self.search_pool = ThreadPoolExecutor(max_workers=SEARCH_WORKERS)
+        self.search_lock = threading.Lock()
+        self.pending_searches = {}
+        self.active_searches = set()
+
+        # File data uses its own port so uploads never block chat frames
+        self.files = FileTransferServer(host, port + 1, storage_dir=storage_dir, on_upload_complete=self.announce_file)
+
+        # Opt-in recording of everything clients send, see replay.py
+        self.capture = TrafficCapture(capture_path) if capture_path else None
+
         self.running = False
         db_manager.initialize_database()
         
@@ -24,6 +43,7 @@ class ChatServer:
         self.server_socket.bind((self.host, self.port))
         self.server_socket.listen()
         self.server_socket.settimeout(1.0)
+        self.files.start()
         
         self.running = True
         print(f"[LISTENING] Server is listening on {self.host}:{self.port}")
@@ -48,9 +68,15 @@ class ChatServer:
             
     def stop(self):
         self.running = False
-        for client in self.clients.values():
+        for client in self.clients.connections():
             client.close()
         self.server_socket.close()
+        self.files.stop()
+        self.search_pool.shutdown(wait=False, cancel_futures=True)
+        db_manager.flush_messages()
+        if self.capture:
+            self.capture.close()
+            print(f"[CAPTURE] Saved to {self.capture.path}")
         print("[CLOSED] Server socket closed")
 
     def send_packet(self, client, type, content, sender="Server", is_private=False, target_group=None):
@@ -62,21 +88,22 @@ class ChatServer:
                 "is_private": is_private,
                 "target_group": target_group
             }
-            client.sendall((json.dumps(packet) + "\n").encode('utf-8'))
+            client.send((json.dumps(packet) + "\n").encode('utf-8'), priority_for(type))
         except:
             pass
 
     def broadcast_packet(self, packet_dict):
         data = (json.dumps(packet_dict) + "\n").encode('utf-8')
-        for client in list(self.clients.values()):
+        priority = priority_for(packet_dict.get("type"))
+        for client in self.clients.connections():
             try:
-                client.sendall(data)
+                client.send(data, priority)
             except:
                 pass
 
     def broadcast_user_list(self):
-        user_list = list(self.clients.keys())
-        group_list = list(self.groups.keys())
+        user_list = self.clients.names()
+        group_list = self.groups.names()
         combined_list = ["Everyone"] + group_list + user_list
         self.broadcast_packet({
             "type": "USER_LIST",
@@ -84,15 +111,24 @@ class ChatServer:
             "sender": "Server"
         })
 
+    def receive_data(self, client, record=True):
+        """recv() wrapper that also feeds the traffic capture when it is on"""
+        data = client.recv(1024)
+        if self.capture and record:
+            self.capture.record_data(client, data)
+        return data.decode('utf-8')
+
     #
-    def receive_json_secure(self, client, buffer):
+    def receive_json_secure(self, client, buffer, secret=False):
         """
         Safely receives one JSON packet using buffer logic.
+        During auth the capture records whole frames instead of raw recv data,
+        so a secret frame (a password) can be stored as a marker instead.
         Returns: (decoded_json, updated_buffer)
         """
         while "\n" not in buffer:
             try:
-                data = client.recv(1024).decode('utf-8')
+                data = self.receive_data(client, record=False)
                 if not data: 
                     return None, buffer
                 buffer += data
@@ -101,24 +137,35 @@ class ChatServer:
         
         
         message, buffer = buffer.split("\n", 1)
+        if self.capture:
+            if secret:
+                self.capture.record_secret(client)
+            else:
+                self.capture.record_data(client, (message + "\n").encode('utf-8'))
         try:
             return json.loads(message), buffer
         except:
             return None, buffer
 
-    def handle_client(self, client, address):
+    def handle_client(self, sock, address):
         print(f"[NEW CONNECTION] {address}", flush=True)
+        # Outbound frames go through priority lanes, control before chat
+        client = ClientConnection(sock)
         client_ip = address[0]
         username = None
+        if self.capture:
+            self.capture.record_open(client)
         
         try:
-            username = self.authenticate_user_json(client)
+            username, buffer = self.authenticate_user_json(client)
             if not username:
                 return
+            if self.capture and buffer:
+                # Received during auth but not part of it, record it as normal data
+                self.capture.record_data(client, buffer.encode('utf-8'))
             
-            self.clients[username] = client
-            if username not in self.groups["#General"]:
-                self.groups["#General"].append(username)
+            self.clients.add(username, client)
+            self.groups.join("#General", username)
 
             print(f"[REGISTERED] {username}")
             self.send_packet(client, "LOGIN_SUCCESS", username, sender="Server")
@@ -127,13 +174,9 @@ class ChatServer:
             })
             self.broadcast_user_list()
             
-            buffer = ""
+            # buffer may already hold frames that arrived with the login
             while True:
                 try:
-                    data = client.recv(1024).decode('utf-8')
-                    if not data: break
-                    buffer += data
-                    
                     while '\n' in buffer:
                         message, buffer = buffer.split('\n', 1)
                         if not message.strip(): continue
@@ -143,46 +186,160 @@ class ChatServer:
                         except:
                             continue
 
+                        if msg_data.get('type') == "SEARCH":
+                            self.queue_search(client, username, msg_data.get('content', ''), msg_data.get('page', 0))
+                            continue
+                        if msg_data.get('type') == "FILE_OFFER":
+                            self.handle_file_offer(client, username, msg_data.get('target', 'Everyone'), msg_data.get('content'))
+                            continue
+                        if msg_data.get('type') == "FILE_GET":
+                            self.handle_file_get(client, username, msg_data.get('content'))
+                            continue
+
                         target = msg_data.get('target', 'Everyone')
                         content = msg_data.get('content', '')
+                        if not isinstance(target, str) or not isinstance(content, str):
+                            continue
 
                         if target.startswith("#"):
-                            if target in self.groups:
-                                if username not in self.groups[target]:
-                                    self.groups[target].append(username)
-                                for member in self.groups[target]:
-                                    if member in self.clients:
-                                        self.send_packet(self.clients[member], "CHAT", content, sender=username, target_group=target)
+                            if self.groups.join(target, username):
+                                clients = self.clients.snapshot()
+                                for member in self.groups.members(target):
+                                    member_socket = clients.get(member)
+                                    if member_socket:
+                                        self.send_packet(member_socket, "CHAT", content, sender=username, target_group=target)
+                                db_manager.save_message(username, target, content)
                         elif target != "Everyone" and target in self.clients:
-                            target_socket = self.clients[target]
+                            target_socket = self.clients.get(target)
                             self.send_packet(target_socket, "CHAT", content, sender=username, is_private=True)
                             self.send_packet(client, "CHAT", content, sender=username, is_private=True, target_group=target)
+                            db_manager.save_message(username, target, content)
                         else:
                             self.broadcast_packet({
                                 "type": "CHAT", "sender": username, "content": content, "is_private": False
                             })
+                            db_manager.save_message(username, "Everyone", content)
+
+                    data = self.receive_data(client)
+                    if not data: break
+                    buffer += data
 
                 except Exception:
                     break
         except Exception as e:
             print(f"[ERROR] {address}: {e}")
         finally:
-            if username and username in self.clients:
-                del self.clients[username]
-                for group in self.groups.values():
-                    if username in group: group.remove(username)
+            if username and self.clients.remove(username, client):
+                self.groups.leave_all(username)
                 self.broadcast_packet({"type": "SYSTEM", "content": f"{username} left.", "sender": "Server"})
                 self.broadcast_user_list()
+            with self.search_lock:
+                self.pending_searches.pop(client, None)
+            if self.capture:
+                self.capture.record_close(client)
             client.close()
 
+    def queue_search(self, client, username, query, page):
+        """Runs the search for this connection, or replaces the one waiting behind it"""
+        if not isinstance(query, str) or not isinstance(page, int):
+            return
+        with self.search_lock:
+            self.pending_searches[client] = (query, page)
+            if client in self.active_searches:
+                return
+            self.active_searches.add(client)
+        self.search_pool.submit(self.run_searches, client, username)
+
+    def run_searches(self, client, username):
+        while True:
+            with self.search_lock:
+                search = self.pending_searches.pop(client, None)
+                if search is None:
+                    self.active_searches.discard(client)
+                    return
+            try:
+                self.handle_search(client, username, *search)
+            except Exception as e:
+                print(f"[SEARCH ERROR] {e}")
+
+    def handle_search(self, client, username, query, page):
+        """
+        Sends one page of search results. The client asks for the next page
+        (same query, page + 1) when the reply says more=True. timed_out=True
+        means the search was cut off, not that nothing matched.
+        """
+        groups = self.groups.groups_of(username)
+        results, has_more, timed_out = db_manager.search_messages(username, query, groups, page=page)
+        self.send_packet(client, "SEARCH_RESULTS", {
+            "query": query,
+            "page": page,
+            "results": results,
+            "more": has_more,
+            "timed_out": timed_out
+        })
+
+    def handle_file_offer(self, client, username, target, offer):
+        """Client wants to upload (or resume uploading) a file, reply with a FILE_READY token"""
+        if not isinstance(offer, dict):
+            return
+        if target.startswith("#"):
+            if not self.groups.join(target, username):
+                self.send_packet(client, "SYSTEM", f"Unknown group {target}.")
+                return
+        elif target != "Everyone" and target not in self.clients:
+            self.send_packet(client, "SYSTEM", f"{target} is not online.")
+            return
+
+        ready, error = self.files.offer(username, target, offer.get('transfer_id'), offer.get('name', 'file'), offer.get('size'))
+        if error:
+            self.send_packet(client, "SYSTEM", error)
+        else:
+            self.send_packet(client, "FILE_READY", ready)
+
+    def handle_file_get(self, client, username, transfer_id):
+        def can_see(transfer):
+            return (transfer.target == "Everyone"
+                    or username in (transfer.sender, transfer.target)
+                    or username in self.groups.members(transfer.target))
+
+        ready, error = self.files.request_download(username, transfer_id, can_see)
+        if error:
+            self.send_packet(client, "SYSTEM", error)
+        else:
+            self.send_packet(client, "FILE_READY", ready)
+
+    def announce_file(self, transfer):
+        """Called once an upload finishes, tells everyone in the target chat about it"""
+        info = transfer.info()
+        sender = transfer.sender
+        target = transfer.target
+        if target.startswith("#"):
+            clients = self.clients.snapshot()
+            for member in self.groups.members(target):
+                member_socket = clients.get(member)
+                if member_socket:
+                    self.send_packet(member_socket, "FILE", info, sender=sender, target_group=target)
+        elif target != "Everyone":
+            self.send_packet(self.clients.get(target), "FILE", info, sender=sender, is_private=True)
+            self.send_packet(self.clients.get(sender), "FILE", info, sender=sender, is_private=True, target_group=target)
+        else:
+            self.broadcast_packet({
+                "type": "FILE", "sender": sender, "content": info, "is_private": False
+            })
+
     def authenticate_user_json(self, client):
+        """
+        Runs the login / register prompts.
+        Returns: (username or None, leftover_buffer). The leftover holds anything
+        the client sent right after its password, it must not be thrown away.
+        """
         auth_buffer = ""
         
         self.send_packet(client, "SYSTEM", "Welcome! Type '1' to Login or '2' to Register:")
         
         try:
             data, auth_buffer = self.receive_json_secure(client, auth_buffer)
-            if not data: return None
+            if not data: return None, auth_buffer
             
             choice = data.get('content', '').strip()
             
@@ -191,57 +348,57 @@ class ChatServer:
                 self.send_packet(client, "SYSTEM", "Username:")
                 
                 data, auth_buffer = self.receive_json_secure(client, auth_buffer) # Safe Receive
-                if not data: return None
+                if not data: return None, auth_buffer
                 username = data.get('content', '').strip()
                 
                 self.send_packet(client, "SYSTEM", "Password:")
                 
-                data, auth_buffer = self.receive_json_secure(client, auth_buffer) # Safe Receive
-                if not data: return None
+                data, auth_buffer = self.receive_json_secure(client, auth_buffer, secret=True) # Safe Receive
+                if not data: return None, auth_buffer
                 password = data.get('content', '').strip()
                 
                 if db_manager.check_credentials(username, password):
                     self.send_packet(client, "SYSTEM", "Login Successful!")
-                    return username
+                    return username, auth_buffer
                 else:
                     self.send_packet(client, "SYSTEM", "Invalid username or password.")
                     client.close()
-                    return None
+                    return None, auth_buffer
 
             # OPTION 2: REGISTER 
             elif choice == '2' or choice.lower() == 'register':
                 self.send_packet(client, "SYSTEM", "Choose a Username:")
                 
                 data, auth_buffer = self.receive_json_secure(client, auth_buffer) # Safe Receive
-                if not data: return None
+                if not data: return None, auth_buffer
                 new_username = data.get('content', '').strip()
                 
                 if db_manager.user_exists(new_username):
                     self.send_packet(client, "SYSTEM", "Username already taken.")
                     client.close()
-                    return None
+                    return None, auth_buffer
                 
                 self.send_packet(client, "SYSTEM", "Choose a Password:")
                 
-                data, auth_buffer = self.receive_json_secure(client, auth_buffer) # Safe Receive
-                if not data: return None
+                data, auth_buffer = self.receive_json_secure(client, auth_buffer, secret=True) # Safe Receive
+                if not data: return None, auth_buffer
                 new_password = data.get('content', '').strip()
                 
                 if db_manager.register_user(new_username, new_password):
                     self.send_packet(client, "SYSTEM", "Account created! You are now logged in.")
-                    return new_username
+                    return new_username, auth_buffer
                 else:
                     self.send_packet(client, "SYSTEM", "Error creating account.")
                     client.close()
-                    return None
+                    return None, auth_buffer
             else:
                 self.send_packet(client, "SYSTEM", "Invalid choice. Disconnecting.")
                 client.close()
-                return None
+                return None, auth_buffer
 
         except Exception as e:
             print(f"[AUTH ERROR] {e}")
-            return None
+            return None, auth_buffer
             
     def admin_write(self):
         while True:
@@ -252,6 +409,14 @@ class ChatServer:
                 break
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Python Chat Application server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=65432)
+    parser.add_argument("--capture", metavar="FILE", help="record inbound client traffic to FILE")
+    parser.add_argument("--uploads", metavar="DIR", default=STORAGE_DIR,
+                        help="where uploaded files are kept, old transfers in it are deleted on start")
+    args = parser.parse_args()
+
     print("Starting server...")
-    server = ChatServer("0.0.0.0", 65432)
+    server = ChatServer(args.host, args.port, capture_path=args.capture, storage_dir=args.uploads)
     server.start()
\ No newline at end of file